@@ -9,15 +9,20 @@ Typical usage:
 """
 
 import argparse
+import concurrent.futures
+import functools
+import mmap
+import os
+import queue
 import re
 import subprocess
 import sys
+import tempfile
 
 from dotenv import load_dotenv
-from langchain_core.output_parsers import StrOutputParser
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
-from openai import OpenAIError
+
+# The LangChain/OpenAI imports are deferred to the functions that use them, so
+# runs that never reach the LLM do not pay their import cost.
 
 
 def run_script(python_executable: str, script: str, script_args, timeout: int):
@@ -46,17 +51,101 @@ def run_script(python_executable: str, script: str, script_args, timeout: int):
     This function does not raise on non-zero exit codes; it returns them so
     the caller can decide how to handle failures.
     """
-    cmd = [python_executable, script] + list(script_args)
-    try:
-        proc = subprocess.run(
-            cmd, capture_output=True, text=True, timeout=timeout, check=False
-        )
-        return proc.stdout, proc.stderr, proc.returncode
-    except subprocess.TimeoutExpired as err:
-        return err.stdout or "", f"TimeoutExpired afetr {timeout}s", 124
-
-
-def local_hints(stderr: str) -> str:
+    cmd = [python_executable, script, *script_args]
+    # Spool output to temporary files rather than pipes so large outputs go to
+    # disk instead of being accumulated in memory while the script runs.
+    with tempfile.TemporaryFile(mode="w+b") as tmp_out, tempfile.TemporaryFile(
+        mode="w+b"
+    ) as tmp_err:
+        try:
+            proc = subprocess.run(
+                cmd, stdout=tmp_out, stderr=tmp_err, timeout=timeout, check=False
+            )
+        except subprocess.TimeoutExpired:
+            return _read_back(tmp_out), f"TimeoutExpired afetr {timeout}s", 124
+        return _read_back(tmp_out), _read_back(tmp_err), proc.returncode
+
+
+def _read_back(tmp) -> str:
+    """Rewind a temporary output file and decode its contents as UTF-8."""
+    tmp.seek(0)
+    return tmp.read().decode("utf-8", "replace")
+
+
+_HINTS = [
+    (
+        "zero_division",
+        r"ZeroDivisionError:",
+        lambda m: "ArithmeticError: division by zero",
+    ),
+    (
+        "module_not_found",
+        r"ModuleNotFoundError: No module named '(?P<module>[^']+)'",
+        lambda m: f"ImportError: Missing dependency: pip install {m.group('module')}",
+    ),
+    (
+        "import_error",
+        r"ImportError: cannot import name '(?P<import_name>[^']+)'",
+        lambda m: f"Import mismatch: check the library version and import path for '{m.group('import_name')}'",
+    ),
+    (
+        "index_error",
+        r"IndexError",
+        lambda m: "Index Error: the value requested is outside the range",
+    ),
+    (
+        "name_error",
+        r"NameError: name '(?P<name>[^']+)' is not defined",
+        lambda m: f"Name '{m.group('name')}' is undefined: typo, missing import, or assignment?",
+    ),
+    (
+        "file_not_found",
+        r"FileNotFoundError: \[Errno 2\] No such file or directory: '(?P<path>[^']+)'",
+        lambda m: f"File not found: {m.group('path')} (check working directory/path)",
+    ),
+    (
+        "permission_error",
+        r"PermissionError: \[Errno 13\]",
+        lambda m: "Permission denied: adjust file permissions or run with appropriate privileges",
+    ),
+    (
+        "syntax_error",
+        r"SyntaxError:",
+        lambda m: "Syntax error: check missing colons, parentheses, or stray characters",
+    ),
+    (
+        "indentation_error",
+        r"IndentationError:",
+        lambda m: "Indentation error: avoid mixing tabs/spaces; use 4 spaces",
+    ),
+    (
+        "type_error",
+        r"TypeError:",
+        lambda m: "Type error: an argument has the wrong type, check the function signature",
+    ),
+    (
+        "value_error",
+        r"ValueError:",
+        lambda m: "Value error: a value is invalid for the expected type/range",
+    ),
+]
+
+# All hint patterns joined into one alternation so stderr is scanned in a single
+# pass; the outer named group that matched (``m.lastgroup``) selects the handler.
+# When several patterns match, `local_hints` uses the last one in stderr.
+_HINT_PATTERN = re.compile(
+    "|".join(f"(?P<{name}>{pattern})" for name, pattern, _ in _HINTS)
+)
+_HINT_HANDLERS = {name: l_func for name, _, l_func in _HINTS}
+_HINT_TAIL_CHARS = 4096
+# Categories whose local hint is already a complete diagnosis; the LLM is only
+# consulted for these when explicitly requested with --llm.
+_CONCLUSIVE_HINTS = frozenset(
+    {"zero_division", "module_not_found", "indentation_error"}
+)
+
+
+def local_hints(stderr: str) -> tuple[str, str]:
     """Derive a quick human-readable hint from common Python error patterns.
 
     Parameters
@@ -66,64 +155,43 @@ def local_hints(stderr: str) -> str:
 
     Returns
     -------
-    str
-        A short hint string if a known pattern is recognized; otherwise an empty string.
+    tuple[str, str]
+        A (category, hint) pair if a known pattern is recognized, where category
+        names the matched pattern (e.g. "zero_division"); otherwise ("", "").
+        The category is only set when the match is on the last non-empty line,
+        i.e. the exception that was actually raised; a hint taken from an earlier
+        (chained) exception is returned as ("", hint).
 
     Examples
     --------
-    - `ZeroDivisionError:` -> `"ArithmeticError: division by zero"`
-    - `ModuleNotFoundError: No module named 'foo'` -> `"ImportError: Missing dependency: pip install foo"`
-    - `NameError: name 'bar' is not defined` -> `Name "bar" is undefined: typo, missing import, or assignment?`
+    - `ZeroDivisionError:` -> `("zero_division", "ArithmeticError: division by zero")`
+    - `ModuleNotFoundError: No module named 'foo'` -> `("module_not_found", "ImportError: Missing dependency: pip install foo")`
+    - `NameError: name 'bar' is not defined` -> `("name_error", Name "bar" is undefined: typo, missing import, or assignment?)`
     """
     if not stderr:
-        return ""
-    patterns = [
-        (r"ZeroDivisionError:", lambda m: "ArithmeticError: division by zero"),
-        (
-            r"ModuleNotFoundError: No module named '([^']+)'",
-            lambda m: f"ImportError: Missing dependency: pip install {m.group(1)}",
-        ),
-        (
-            r"ImportError: cannot import name '([^']+)'",
-            lambda m: f"Import mismatch: check the library version and import path for '{m.group(1)}'",
-        ),
-        (
-            r"IndexError",
-            lambda m: "Index Error: the value requested is outside the range",
-        ),
-        (
-            r"NameError: name '([^']+)' is not defined",
-            lambda m: f"Name '{m.group(1)}' is undefined: typo, missing import, or assignment?",
-        ),
-        (
-            r"FileNotFoundError: \\[Errno 2\\] No such file or directory: '([^']+)'",
-            lambda m: f"File not found: {m.group(1)} (check working directory/path)",
-        ),
-        (
-            r"PermissionError: \\[Errno 13\\]",
-            lambda m: "Permission denied: adjust file permissions or run with appropriate privileges",
-        ),
-        (
-            r"SyntaxError:",
-            lambda m: "Syntax error: check missing colons, parentheses, or stray characters",
-        ),
-        (
-            r"IndentationError:",
-            lambda m: "Indentation error: avoid mixing tabs/spaces; use 4 spaces",
-        ),
-        (
-            r"TypeError:",
-            lambda m: "Type error: an argument has the wrong type, check the function signature",
-        ),
-        (
-            r"ValueError:",
-            lambda m: "Value error: a value is invalid for the expected type/range",
-        ),
-    ]
-    for pattern, l_func in patterns:
-        m = re.search(pattern, stderr)
-        if m:
-            return l_func(m)
+        return "", ""
+    # The exception line of a traceback is at the end, so only scan the tail
+    # (widened back to a line start so the exception line is never cut), and
+    # keep the last match: in chained tracebacks the final exception is the one
+    # that was actually raised.
+    start = stderr.rfind("\n", 0, max(len(stderr) - _HINT_TAIL_CHARS, 0)) + 1
+    m = None
+    for m in _HINT_PATTERN.finditer(stderr, start):
+        pass
+    if not m:
+        return "", ""
+    hint = _HINT_HANDLERS[m.lastgroup](m)
+    final_line = stderr.rfind("\n", 0, len(stderr.rstrip())) + 1
+    if m.start() < final_line:
+        return "", hint
+    return m.lastgroup, hint
+
+
+def _char_boundary(data, pos: int, step: int) -> int:
+    """Move `pos` by `step` past UTF-8 continuation bytes (0b10xxxxxx) in `data`."""
+    while 0 < pos < len(data) and data[pos] & 0xC0 == 0x80:
+        pos += step
+    return pos
 
 
 def get_excerpt(path: str, max_chars: int = 2000) -> str:
@@ -134,7 +202,9 @@ def get_excerpt(path: str, max_chars: int = 2000) -> str:
     path : str
         Path to the text file to read (typically a Python source file).
     max_chars : int, optional
-        Target maximum character budget for the returned text, by default 2000.
+        Size budget for the excerpt, in bytes of the UTF-8 source (the same as
+        characters for ASCII files), by default 2000. Zero or a negative value
+        means no limit.
 
     Returns
     -------
@@ -142,17 +212,165 @@ def get_excerpt(path: str, max_chars: int = 2000) -> str:
         The full file content if it fits within `max_chars`. Otherwise a concatenation
         of the first half and last half separated by a trim marker. Returns an empty
         string if the file does not exist.
+
+    Notes
+    -----
+    The size check and trimming are done on the encoded file size, so only the
+    head and tail regions are read from large files. Both cuts are moved to the
+    nearest UTF-8 character boundary inside the budget, so no character is split;
+    when the budget is smaller than a character, each side keeps one character.
     """
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            text = f.read()
-            if len(text) <= max_chars or max_chars == 0:
-                return text
-            head = text[: max_chars // 2]
-            tail = text[-max_chars // 2 :]
-            return head + "\n...\n[TRIMMED]\n...\n" + tail
+        size = os.path.getsize(path)
+        if max_chars <= 0 or size <= max_chars:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                return f.read()
+        # Map the file so only the pages backing the head and tail are read in.
+        half = max(max_chars // 2, 1)
+        with open(path, "rb") as f, mmap.mmap(
+            f.fileno(), 0, access=mmap.ACCESS_READ
+        ) as mm:
+            # Back off to character boundaries inside the budget; if that would
+            # leave a side empty, extend it to the next boundary instead.
+            head_end = _char_boundary(mm, half, -1) or _char_boundary(mm, half, 1)
+            tail_start = _char_boundary(mm, len(mm) - half, 1)
+            if tail_start == len(mm):
+                tail_start = _char_boundary(mm, len(mm) - half, -1)
+            head = mm[:head_end]
+            tail = mm[tail_start:]
     except FileNotFoundError:
         return ""
+    return (
+        head.decode("utf-8", "replace")
+        + "\n...\n[TRIMMED]\n...\n"
+        + tail.decode("utf-8", "replace")
+    )
+
+
+LLM_CACHE_PATH = os.path.join(
+    os.path.expanduser("~"), ".cache", "python_diagnose", "llm.sqlite"
+)
+
+
+def setup_llm_cache(database_path: str = LLM_CACHE_PATH):
+    """Enable LangChain's on-disk LLM response cache.
+
+    Identical prompts (same model, stderr, stdout and code excerpt) are answered
+    from the cache instead of making another API call.
+
+    Parameters
+    ----------
+    database_path : str, optional
+        Path of the SQLite database backing the cache, by default
+        `~/.cache/python_diagnose/llm.sqlite`.
+    """
+    from langchain_community.cache import SQLiteCache
+    from langchain_core.globals import set_llm_cache
+
+    os.makedirs(os.path.dirname(database_path), exist_ok=True)
+    set_llm_cache(SQLiteCache(database_path=database_path))
+
+
+# Keep every static instruction in the system message and the human message
+# purely dynamic, so providers can reuse the cached prompt prefix.
+_SYSTEM_PROMPT = """
+    You are a careful Python error analyzer,
+    Explain likely root cause, list minimal fix steps, and "why this works" concisely,
+
+    Analyze the failure described in the user message and propose minimal fixes.
+    The user message has three sections separated by lines containing only "---":
+    1. stderr (traceback)
+    2. stdout
+    3. code excerpt (may be trimmed)
+"""
+
+
+@functools.lru_cache(maxsize=4)
+def _get_chain(model: str):
+    """Build the llm | parser chain for `model`, cached per model name.
+
+    Raises
+    ------
+    OpenAIError
+        If the LLM client cannot be initialized (e.g., missing API key).
+    """
+    from langchain_core.output_parsers import StrOutputParser
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(model=model) | StrOutputParser()
+
+
+def llm_diagnose_stream(
+    stderr: str, stdout: str, code_snippet: str, model: str = "gpt-5-nano"
+):
+    """Ask an LLM to analyze the failure, yielding the diagnosis as it is generated.
+
+    Takes the same parameters as `llm_diagnose`.
+
+    Yields
+    ------
+    str
+        Successive chunks of the model's diagnosis. If the LLM client cannot be
+        initialized, yields a single "(LLM unavaiable: <error>)" message.
+
+    Notes
+    -----
+    LangChain's streaming API bypasses the LLM cache, so when a cache is
+    configured (see `setup_llm_cache`) it is consulted here directly, using the
+    same keys as `invoke`: a hit is yielded as a single chunk, and a streamed
+    miss is written back to the cache once the response is complete.
+    """
+    from langchain_core.globals import get_llm_cache
+    from langchain_core.messages import HumanMessage, SystemMessage
+    from openai import OpenAIError
+
+    try:
+        chain = _get_chain(model)
+    except OpenAIError as err:
+        yield "(LLM unavaiable: " + str(err) + ")"
+        return
+
+    # Messages are built directly rather than rendered through a prompt template.
+    messages = [
+        SystemMessage(content=_SYSTEM_PROMPT),
+        HumanMessage(content=f"{stderr}\n---\n{stdout}\n---\n{code_snippet}"),
+    ]
+    cache = get_llm_cache()
+    if cache is None:
+        yield from chain.stream(messages)
+    else:
+        yield from _stream_through_cache(cache, chain, messages)
+
+
+def _stream_through_cache(cache, chain, messages):
+    """Stream `chain` over `messages`, reading from and writing to the LLM `cache`.
+
+    A hit is yielded as a single chunk; a miss is streamed and the joined text is
+    stored once the stream completes.
+    """
+    from langchain_core.load import dumps
+    from langchain_core.messages import AIMessage
+    from langchain_core.outputs import ChatGeneration
+
+    # This mirrors the cache key and entry format of
+    # BaseChatModel._generate_with_cache in langchain-core 0.3.x (as pulled in by
+    # langchain-openai==0.3.34), including the private `_get_llm_string`, so
+    # streamed and `invoke` calls share entries. Recheck it when upgrading
+    # LangChain: a mismatch shows up only as silent cache misses.
+    llm = chain.first
+    prompt = dumps(messages)
+    llm_string = llm._get_llm_string()
+    cached = cache.lookup(prompt, llm_string)
+    if cached:
+        yield cached[0].text
+        return
+
+    parts = []
+    for chunk in chain.stream(messages):
+        parts.append(chunk)
+        yield chunk
+    text = "".join(parts)
+    cache.update(prompt, llm_string, [ChatGeneration(message=AIMessage(content=text))])
 
 
 def llm_diagnose(
@@ -182,39 +400,71 @@ def llm_diagnose(
         initialized, returns a message in the form "(LLM unavaiable: <error>)".
 
     """
-    try:
-        llm = ChatOpenAI(model=model)
-    except OpenAIError as err:
-        return "(LLM unavaiable: " + str(err) + ")"
+    return "".join(llm_diagnose_stream(stderr, stdout, code_snippet, model)).strip()
 
-    system = """
-        You are a careful Python error analyzer,
-        Explain likely root cause, list minimal fix steps, and "why this works" concisely,
+
+def _stream_in_background(executor, make_chunks):
+    """Consume `make_chunks()` on `executor` and return an iterator over its chunks.
+
+    Chunks are handed over through a queue so production starts immediately,
+    while the caller can iterate later from the main thread. Exceptions raised
+    by the producer are re-raised once the iterator is exhausted.
     """
-    prompt = ChatPromptTemplate.from_messages(
-        [
-            ("system", system),
-            (
-                "human",
-                """
-Analyze this failure and propose minimal fixes.
-
-stderr (traceback):
-{stderr}
-
-stdout:
-{stdout}
-
-code excerpt (may be trimmed):
-{code}
-                """,
-            ),
-        ]
-    )
+    chunks = queue.Queue()
+
+    def produce():
+        try:
+            for chunk in make_chunks():
+                chunks.put(chunk)
+        finally:
+            chunks.put(None)
+
+    future = executor.submit(produce)
+
+    def consume():
+        while (chunk := chunks.get()) is not None:
+            yield chunk
+        future.result()
+
+    return consume()
+
 
-    chain = prompt | llm | StrOutputParser()
-    text = chain.invoke({"stderr": stderr, "stdout": stdout, "code": code_snippet})
-    return text.strip()
+def _write_section(header: str, body: str):
+    """Write `header` and `body` to stdout on separate lines.
+
+    The parts are written one after another instead of concatenated, so a large
+    captured output is not copied just to be printed.
+    """
+    sys.stdout.write(header + "\n")
+    sys.stdout.write(body or "")
+    sys.stdout.write("\n")
+
+
+def _write_stream(header: str, chunks):
+    """Write `header` followed by `chunks` to stdout, flushing as each chunk arrives.
+
+    Leading and trailing whitespace of the stream is dropped, and nothing (not
+    even the header) is written if the stream is empty.
+    """
+    started = False
+    # Whitespace is held back until more text follows, so none is left trailing.
+    pending = ""
+    for chunk in chunks:
+        if not started:
+            chunk = chunk.lstrip()
+            if not chunk:
+                continue
+            sys.stdout.write(header + "\n")
+            started = True
+        body = chunk.rstrip()
+        if not body:
+            pending += chunk
+            continue
+        sys.stdout.write(pending + body)
+        sys.stdout.flush()
+        pending = chunk[len(body) :]
+    if started:
+        sys.stdout.write("\n")
 
 
 def build_parser():
@@ -227,9 +477,11 @@ def build_parser():
         - script: path to the Python script to run
         - script_args: remaining args passed through to the script
         - --timeout: max seconds before timing out (default: 60)
-        - --llm/no-llm: if set, enable/disable LLM diagnosis (default: True)
+        - --llm/no-llm: if set, always/never use LLM diagnosis (default: use it
+          unless the local hint is conclusive)
         - --model: LLM model name (default: "gpt-5-nano")
-        - --trim: maximum characters sent to LLM (default: 2000), set to 0 to remove limit
+        - --cache/no-cache: if set, enable/disable the LLM response cache (default: True)
+        - --trim: maximum bytes of source sent to LLM (default: 2000), set to 0 (or less) to remove limit
     """
     p = argparse.ArgumentParser(description="Run a Python script and diagnose errors")
     p.add_argument("script", help="Path to Python script")
@@ -241,14 +493,22 @@ def build_parser():
         help="Time in seconds to analyze before timing out",
     )
     p.add_argument(
-        "--llm", action=argparse.BooleanOptionalAction, help="Use LLM", default=True
+        "--llm",
+        action=argparse.BooleanOptionalAction,
+        help="Use LLM (default: unless the quick hint is conclusive)",
     )
     p.add_argument("--model", default="gpt-5-nano", help="LLM model name")
+    p.add_argument(
+        "--cache",
+        action=argparse.BooleanOptionalAction,
+        help="Reuse cached LLM responses for identical failures",
+        default=True,
+    )
     p.add_argument(
         "--trim",
         type=int,
         default=2000,
-        help="Max characters to send to LLM",
+        help="Max bytes of script source to send to LLM",
     )
     return p
 
@@ -261,8 +521,11 @@ def main():
     1. Load environment variables (for API keys, etc.).
     2. Parse CLI args and run the target script with a timeout.
     3. Print stdout, stderr, and exit code.
-    4. If a common exception is detected, print it.
-    5. If the script failed and LLM diagnosis is enabled, call the LLM and print its analysis.
+    4. If the script failed and a common exception is detected, print it.
+    5. If the script failed and LLM diagnosis is enabled (by default, only when the
+       quick hint is not conclusive on its own), call the LLM (through the
+       response cache unless disabled) in the background while steps 3-4 print,
+       then stream its analysis to stdout.
     6. Exit with the target script’s return code.
 
     Side Effects
@@ -276,18 +539,34 @@ def main():
         sys.executable, args.script, args.script_args, args.timeout
     )
 
-    hint = local_hints(stderr)
-    print("=== stdout ===\n" + (stdout or ""))
-    print("=== stderr ===\n" + (stderr or ""))
-    print(f"=== exit code ===\n{exit_code}")
-    if hint:
-        print("=== quick hint ===\n" + hint)
-    if exit_code != 0 and args.llm:
-        diag = llm_diagnose(
-            stderr, stdout, get_excerpt(args.script, args.trim), model=args.model
-        )
-        if diag:
-            print("=== llm diagnosis ===\n" + diag)
+    category, hint = local_hints(stderr) if exit_code != 0 and stderr else ("", "")
+    use_llm = args.llm or (args.llm is None and category not in _CONCLUSIVE_HINTS)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        # Start the LLM request first so it is in flight while outputs are printed.
+        diag_chunks = None
+        if exit_code != 0 and use_llm:
+
+            def diagnose():
+                # Cache setup imports SQLAlchemy and opens the database, so it
+                # runs in the background along with the request itself.
+                if args.cache:
+                    setup_llm_cache()
+                return llm_diagnose_stream(
+                    stderr,
+                    stdout,
+                    get_excerpt(args.script, args.trim),
+                    model=args.model,
+                )
+
+            diag_chunks = _stream_in_background(executor, diagnose)
+
+        _write_section("=== stdout ===", stdout)
+        _write_section("=== stderr ===", stderr)
+        print(f"=== exit code ===\n{exit_code}")
+        if hint:
+            print("=== quick hint ===\n" + hint)
+        if diag_chunks is not None:
+            _write_stream("=== llm diagnosis ===", diag_chunks)
     sys.exit(exit_code)
 
 
@@ -0,0 +1,13 @@
+# This script intentionally errors for demonstration
+def parse_ratio(text):
+    try:
+        numerator, denominator = (int(part) for part in text.split("/"))
+    except ValueError:
+        # Falling back to a zero denominator raises a second, chained exception
+        return 1 / 0
+    return numerator / denominator
+
+
+if __name__ == "__main__":
+    print("About to parse a malformed ratio...")
+    print(parse_ratio("one/two"))
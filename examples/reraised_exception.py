@@ -0,0 +1,11 @@
+# This script intentionally errors for demonstration
+def load_config(values):
+    try:
+        return {"scale": 1 / values["divisor"]}
+    except ZeroDivisionError as e:
+        raise RuntimeError("config load failed") from e
+
+
+if __name__ == "__main__":
+    print("About to load a config with a zero divisor...")
+    print(load_config({"divisor": 0}))